@@ -1,6 +1,16 @@
 """Core classes to represent the user cart and items in it."""
+import json
+from decimal import Decimal
+from numbers import Integral
+
 from django.conf import settings
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 __all__ = [
     'BaseCart',
@@ -46,6 +56,10 @@ class BaseItem(object):
     ZeroItemQuantity
 
     """
+    # Extra attributes set from keyword arguments still live in __dict__,
+    # but it's only created for items that have some.
+    __slots__ = ('_quantity', 'price', 'obj', '_kwargs', '__dict__',
+                 '__weakref__')
     cart = None  # Set during instantiation of the cart class
     """A reference to the instance of the cart class holding the item."""
     PRICE_ATTR = 'price'
@@ -79,7 +93,18 @@ class BaseItem(object):
         self._kwargs = kwargs
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (self.__class__ is other.__class__ and
+                self._quantity == other._quantity and
+                self.obj == other.obj and
+                # Extra attributes are set from these, so reading
+                # __dict__, which would create it, isn't needed.
+                self._kwargs == other._kwargs)
+
+    def __ne__(self, other):
+        return not self == other
+
+    # Items are mutable, so they shouldn't be hashable
+    __hash__ = None
 
     def __repr__(self):
         main_args = 'obj={}, quantity={}'.format(self.obj, self.quantity)
@@ -113,6 +138,10 @@ class BaseItem(object):
         item's price and quantity. Override to adjust for things like
         an individual item discount or taxes.
 
+        Note that the cart adjusts its total price by the change in
+        the item's total, so the value shouldn't depend on other items
+        in the cart.
+
         """
         return self.quantity * self.price
 
@@ -145,7 +174,7 @@ class BaseItem(object):
         return _clean_quantity(quantity, self.max_quantity)
 
 
-class BaseCart(object):
+class BaseCart(object):  #pylint:disable=too-many-instance-attributes
     """Base class representing the user cart.
 
     In the simplest case, you just subclass it in your views and
@@ -166,11 +195,6 @@ class BaseCart(object):
         corresponding instances of :attr:`item_class`.
         If, for some reason, you need to modify `items` directly,
         don't forget to call :meth:`update` afterwards.
-    item_count : int
-        The total number of items in the cart. By default, only unique
-        items are counted.
-    total_price : same as the type of item prices
-        The total value of all items in the cart.
     request
         A reference to the `request` used to instantiate the cart.
 
@@ -178,15 +202,29 @@ class BaseCart(object):
     item_class = BaseItem
     """Class to use to represent cart items."""
     _stale_pks = None
+    # Set when a cart method has already adjusted the totals, so that
+    # the following call to update() may skip recounting them.
+    _totals_shifted = False
+    # Same as above, but for the session data of changed items.
+    _items_stored = False
+    # The JSON produced by encode() without a formatter
+    _encoded_cart = None
 
     def __init__(self, request):
         self.item_class.cart = self
         self.request = request
-        session_data = request.session.setdefault(session_key, {})
+        # The cart data are put into the session on the first update,
+        # so that an empty cart doesn't cause the session to be saved.
+        session_data = request.session.get(session_key)
+        if session_data is None:
+            session_data = {}
         session_items = session_data.setdefault('items', {})
+        self._session_data = session_data
         self.items = self.create_items(session_items)
-        self.item_count = session_data.get('itemCount', 0)
-        self.total_price = session_data.get('totalPrice', 0)
+        # The session stores the total price as a string, so the totals
+        # are counted from the items to keep the type of item prices.
+        self._cached_item_count = self.count_items()
+        self._cached_total_price = self.count_total_price()
         if self._stale_pks:
             self.handle_stale_items(self._stale_pks)
 
@@ -218,15 +256,108 @@ class BaseCart(object):
         pk = str(pk)
         if pk in self.items:
             existing_item = self.items[pk]
+            old_total = existing_item.total
             existing_item.quantity += _clean_quantity(quantity)
+            self._shift_totals(existing_item.total - old_total)
         else:
-            queryset = self.get_queryset([pk])
+            # Objects fetched during the request are cached on it, so that
+            # adding the same item again doesn't hit the database. Cart
+            # classes may fetch objects differently, so each of them gets
+            # its own entries.
+            request = self.request
+            # pylint:disable=protected-access
+            try:
+                obj_cache = request._easycart_obj_cache
+            except AttributeError:
+                obj_cache = request._easycart_obj_cache = {}
+            # pylint:enable=protected-access
+            cache_key = (self.__class__, pk)
             try:
-                obj = queryset[0]
-            except IndexError:
-                raise ItemNotInDatabase(pk=pk)
+                obj = obj_cache[cache_key]
+            except KeyError:
+                obj = next(iter(self.get_queryset([pk])), None)
+                if obj is None:
+                    raise ItemNotInDatabase(pk=pk)
+                obj_cache[cache_key] = obj
             obj = self.process_object(obj)
-            self.items[pk] = self.item_class(obj, quantity, **kwargs)
+            item = self.items[pk] = self.item_class(obj, quantity, **kwargs)
+            self._shift_totals(item.total, 1)
+        self._store_items([pk])
+        self.update()
+
+    def add_many(self, items, **kwargs):
+        """Add several items to the cart at once.
+
+        Works like :meth:`add`, but fetches all items that are not in
+        the cart yet using a single query to the database, and updates
+        the cart only once. If any of the items can't be added, the
+        cart is left unchanged.
+
+        Parameters
+        ----------
+        items : dict
+            A map between primary keys of items (str or int) and
+            quantities of units to add (int-convertible). If the same
+            item is given by both an int and a str key, the quantities
+            are added up.
+        **kwargs
+            Extra keyword arguments to pass to the item class
+            constructor for each item that is not in the cart yet.
+
+        Raises
+        ------
+        ItemNotInDatabase
+        NegativeItemQuantity
+        NonConvertibleItemQuantity
+        TooLargeItemQuantity
+        ZeroItemQuantity
+
+        Examples
+        --------
+        >>> cart = Cart(request)
+        >>> cart.add_many({'1': 2, '4': 1})
+
+        """
+        # Check the quantities before querying the database. Only the
+        # maximum quantity, which may vary from item to item, is checked
+        # when the items are changed or created.
+        quantities = {}
+        for pk, quantity in items.items():
+            # Quantities of the same item given under both an int and
+            # a str pk are added up.
+            pk = str(pk)
+            quantities[pk] = (quantities.get(pk, 0) +
+                              _clean_quantity(quantity))
+        if not quantities:
+            return
+        # Check new quantities of the items already in the cart, before
+        # changing any of them.
+        new_quantities = {}
+        new_pks = []
+        for pk, quantity in quantities.items():
+            try:
+                existing_item = self.items[pk]
+            except KeyError:
+                new_pks.append(pk)
+            else:
+                new_quantities[pk] = existing_item.clean_quantity(
+                    existing_item.quantity + quantity)
+        new_items = {}
+        if new_pks:
+            objects = {str(obj.pk): obj for obj in self.get_queryset(new_pks)}
+            item_class = self.item_class
+            process_object = self.process_object
+            for pk in new_pks:
+                try:
+                    obj = objects[pk]
+                except KeyError:
+                    raise ItemNotInDatabase(pk=pk)
+                obj = process_object(obj)
+                new_items[pk] = item_class(obj, quantities[pk], **kwargs)
+        for pk, quantity in new_quantities.items():
+            self.items[pk].quantity = quantity
+        self.items.update(new_items)
+        self._store_items(quantities)
         self.update()
 
     def change_quantity(self, pk, quantity):
@@ -253,7 +384,10 @@ class BaseCart(object):
             item = self.items[pk]
         except KeyError:
             raise ItemNotInCart(pk=pk)
+        old_total = item.total
         item.quantity = quantity
+        self._shift_totals(item.total - old_total)
+        self._store_items([pk])
         self.update()
 
     def remove(self, pk):
@@ -271,16 +405,48 @@ class BaseCart(object):
         """
         pk = str(pk)
         try:
-            del self.items[pk]
+            item = self.items.pop(pk)
         except KeyError:
             raise ItemNotInCart(pk=pk)
+        # The totals of an emptied cart are recounted, so that they are
+        # the same as those of any other empty cart (e.g. 0 and not 0.00).
+        if self.items:
+            self._shift_totals(-item.total, -1)
+        self._store_items([pk])
         self.update()
 
     def empty(self):
         """Remove all items from the cart."""
+        if not self.items:
+            return
         self.items.clear()
         self.update()
 
+    @property
+    def item_count(self):
+        """int: The total number of items in the cart.
+
+        A read-only property.
+
+        By default, only unique items are counted (see
+        :meth:`count_items`). The value is cached and brought up to
+        date by :meth:`update`.
+
+        """
+        return self._cached_item_count
+
+    @property
+    def total_price(self):
+        """same as the type of item prices: The total value of all items
+        in the cart.
+
+        A read-only property.
+
+        The value is cached and brought up to date by :meth:`update`.
+
+        """
+        return self._cached_total_price
+
     def list_items(self, sort_key=None, reverse=False):
         """Return a list of cart items.
 
@@ -318,6 +484,9 @@ class BaseCart(object):
     def encode(self, formatter=None):
         """Return a representation of the cart as a JSON-response.
 
+        Unless the `formatter` is given, the encoded representation is
+        cached until the next call to :meth:`update`.
+
         Parameters
         ----------
         formatter : func, optional
@@ -326,7 +495,9 @@ class BaseCart(object):
 
         Returns
         -------
-        django.http.JsonResponse
+        django.http.HttpResponse
+            A response with the JSON-encoded cart representation.
+            If orjson_ is installed, it's used to encode the data.
 
         Examples
         --------
@@ -348,12 +519,17 @@ class BaseCart(object):
             "totalPrice": "2,000",
         }'
 
+        .. _orjson: https://github.com/ijl/orjson
+
         """
+        # The unformatted representation is cached until the next update
+        if not formatter and self._encoded_cart is not None:
+            return HttpResponse(self._encoded_cart,
+                                content_type='application/json')
         items = {}
         # The prices are converted to strings, because they may have a
         # type that can't be serialized to JSON (e.g. Decimal).
-        for item in self.items.values():
-            pk = str(item.obj.pk)
+        for pk, item in self.items.items():
             items[pk] = {
                 'price': str(item.price),
                 'quantity': item.quantity,
@@ -365,8 +541,10 @@ class BaseCart(object):
             'totalPrice': str(self.total_price),
         }
         if formatter:
-            cart_repr = formatter(cart_repr)
-        return JsonResponse(cart_repr)
+            content = _dump_json(formatter(cart_repr))
+        else:
+            content = self._encoded_cart = _dump_json(cart_repr)
+        return HttpResponse(content, content_type='application/json')
 
     def get_queryset(self, pks):
         """Construct a queryset using given primary keys.
@@ -380,7 +558,10 @@ class BaseCart(object):
 
         Returns
         -------
-        django.db.models.query.QuerySet
+        django.db.models.query.QuerySet or iterable of model instances
+            The cart only iterates over the returned value, so, if it
+            suits you better, you may return something else, e.g. the
+            values of a dict produced by ``QuerySet.in_bulk()``.
 
         Examples
         --------
@@ -456,6 +637,8 @@ class BaseCart(object):
                  '3': <CartItem: obj=bar, quantity=2>}
 
         """
+        if not session_items:
+            return {}
         pks = list(session_items.keys())
         items = {}
         item_class = self.item_class
@@ -473,26 +656,82 @@ class BaseCart(object):
 
         First this method updates attributes dependent on the cart's
         `items`, such as `total_price` or `item_count`.
-        After that, it saves the new cart state to the session.
+        After that, it saves the new cart state to the session, unless
+        the state is the same as the one already saved.
 
         Generally, you'll need to call this method by yourself, only
         when implementing new methods that directly change the `items`
         attribute.
 
         """
-        self.item_count = self.count_items()
-        self.total_price = self.count_total_price()
+        if self._totals_shifted:
+            # The totals have already been adjusted by the caller
+            self._totals_shifted = False
+        else:
+            self._cached_item_count = self.count_items()
+            self._cached_total_price = self.count_total_price()
+        self._encoded_cart = None
         # Update the session
-        session = self.request.session
-        session_items = {}
-        for pk, item in self.items.items():
-            session_items[pk] = dict(quantity=item.quantity, **item._kwargs)
-        session_data = session[session_key]
-        session_data['items'] = session_items
-        session_data['itemCount'] = self.item_count
+        session_data = self._session_data
+        changed = self._items_stored
+        if self._items_stored:
+            # The changed items have already been saved by the caller
+            self._items_stored = False
+        else:
+            session_items = {}
+            for pk, item in self.items.items():
+                session_items[pk] = _encode_session_item(item)
+            if session_items != session_data['items']:
+                session_data['items'] = session_items
+                changed = True
+        item_count = self.item_count
         # The price can be of a type that can't be serialized to JSON
-        session_data['totalPrice'] = str(self.total_price)
-        session.modified = True
+        total_price = str(self.total_price)
+        if (changed or
+                session_data.get('itemCount') != item_count or
+                session_data.get('totalPrice') != total_price):
+            session_data['itemCount'] = item_count
+            session_data['totalPrice'] = total_price
+            # Also marks the session as modified
+            self.request.session[session_key] = session_data
+
+    def _store_items(self, pks):
+        # Save the state of the given items to the session data in place,
+        # so that the following call to update() doesn't have to rebuild
+        # the session data for all items in the cart.
+        session_items = self._session_data['items']
+        for pk in pks:
+            try:
+                item = self.items[pk]
+            except KeyError:
+                session_items.pop(pk, None)
+            else:
+                session_items[pk] = _encode_session_item(item)
+        # Entries of stale items, which a custom handle_stale_items() may
+        # leave in the session, are only dropped by a full rebuild.
+        if self._stale_pks or len(session_items) != len(self.items):
+            return
+        self._items_stored = True
+
+    def _shift_totals(self, price_delta, count_delta=0):
+        # Adjust the cached totals after a change of a single item, so
+        # that the following call to update() doesn't have to recount
+        # them by iterating over all items. If the way the totals are
+        # counted has been customized, or the prices are inexact (e.g.
+        # floats, whose rounding errors would pile up), it's left to
+        # update() to recount them.
+        if not (self._has_default_counters() and
+                isinstance(price_delta, _EXACT_PRICE_TYPES) and
+                isinstance(self._cached_total_price, _EXACT_PRICE_TYPES)):
+            return
+        self._cached_total_price += price_delta
+        self._cached_item_count += count_delta
+        self._totals_shifted = True
+
+    def _has_default_counters(self):
+        cls = self.__class__
+        return (cls.count_items == BaseCart.count_items and
+                cls.count_total_price == BaseCart.count_total_price)
 
     def count_items(self, unique=True):
         """Count items in the cart.
@@ -511,11 +750,33 @@ class BaseCart(object):
         """
         if unique:
             return len(self.items)
-        return sum([item.quantity for item in self.items.values()])
+        return sum(item.quantity for item in self.items.values())
 
     def count_total_price(self):
         """Get the total price of all items in the cart."""
-        return sum((item.total for item in self.items.values()))
+        return sum(item.total for item in self.items.values())
+
+
+# Price types whose sums don't accumulate rounding errors
+_EXACT_PRICE_TYPES = (Integral, Decimal)
+
+
+def _encode_session_item(item):
+    return dict(quantity=item.quantity, **item._kwargs)
+
+
+def _dump_json(data):
+    # Values orjson can't serialize natively (e.g. Decimal) are converted
+    # to strings, same as DjangoJSONEncoder does.
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # E.g. integers beyond 64 bits, which only the standard
+            # library can encode
+            pass
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
 
 
 def _clean_quantity(quantity, max_quantity=None):
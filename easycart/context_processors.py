@@ -1,11 +1,17 @@
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
 from easycart.views import Cart
 
 __all__ = ['cart']
 
 context_var = getattr(settings, 'EASYCART_CONTEXT_VAR', 'cart')
+eager_context = getattr(settings, 'EASYCART_EAGER_CONTEXT', False)
 
 
 def cart(request):
-    return {context_var: Cart(request)}
+    # The cart hits the database on instantiation, so by default it is not
+    # created until a template actually uses it.
+    if eager_context:
+        return {context_var: Cart(request)}
+    return {context_var: SimpleLazyObject(lambda: Cart(request))}
@@ -0,0 +1,22 @@
+"""Helpers to load classes specified in the settings."""
+try:
+    from functools import lru_cache
+except ImportError:
+    from django.utils.lru_cache import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+__all__ = ['get_cart_class']
+
+
+@lru_cache(maxsize=None)
+def get_cart_class():
+    """Return the cart class specified by the EASYCART_CART_CLASS setting.
+
+    The class is imported on the first call. Subsequent calls return the
+    same class object, so the built-in views, the context processor and
+    your own code all share it.
+
+    """
+    return import_string(settings.EASYCART_CART_CLASS)
@@ -2,6 +2,7 @@ from django.conf.urls import url
 
 from easycart.views import (
     AddItem,
+    AddItems,
     RemoveItem,
     ChangeItemQuantity,
     EmptyCart,
@@ -9,6 +10,7 @@ from easycart.views import (
 
 urlpatterns = [
     url(r'^add/$', AddItem.as_view(), name='cart-add'),
+    url(r'^add-many/$', AddItems.as_view(), name='cart-add-many'),
     url(r'^remove/$', RemoveItem.as_view(), name='cart-remove'),
     url(r'^change-quantity/$', ChangeItemQuantity.as_view(),
         name='cart-change-quantity'),
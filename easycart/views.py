@@ -10,6 +10,9 @@ data, then the JSON-response will have the format::
 
    {'error': 'MissingRequestParam', 'param': parameter_name}
 
+If a parameter expected to contain a JSON-object can't be decoded, then
+the error value will be ``'InvalidRequestParam'``.
+
 Almost the same thing happens, if a parameter is invalid and results in
 an exception, which is a subclass of :class:`~easycart.cart.CartException`.
 In this case, the error value will be the name of the concrete exception
@@ -38,23 +41,23 @@ Feel free to reopen the issue, if you have any suggestions on how to
 improve the situation.
 
 """
-from importlib import import_module
+import json
 
-from django.conf import settings
 from django.http import JsonResponse
 from django.views.generic import View
 
 from easycart.cart import CartException
+from easycart.loading import get_cart_class
 
 __all__ = [
     'AddItem',
+    'AddItems',
     'RemoveItem',
     'ChangeItemQuantity',
     'EmptyCart',
 ]
 
-cart_module, cart_class = settings.EASYCART_CART_CLASS.rsplit('.', 1)
-Cart = getattr(import_module(cart_module), cart_class)
+Cart = get_cart_class()
 
 
 class CartView(View):
@@ -71,20 +74,40 @@ class CartView(View):
     Parameters serve as keys. Associated values will be used as fallbacks
     in case the parameter is not in the post data.
     """
+    json_params = ()
+    """Iterable of parameters, whose values are JSON-encoded objects.
+
+    Each of them should also be listed in either `required_params` or
+    `optional_params`, otherwise it's ignored.
+    """
 
     def post(self, request):
         # Extract parameters from the post data
+        post_data = request.POST
         params = {}
         for param in self.required_params:
             try:
-                params[param] = request.POST[param]
+                params[param] = post_data[param]
             except KeyError:
                 return JsonResponse({
                     'error': 'MissingRequestParam',
                     'param': param,
                 })
         for param, fallback in self.optional_params.items():
-            params[param] = request.POST.get(param, fallback)
+            params[param] = post_data.get(param, fallback)
+        for param in self.json_params:
+            if param not in params:
+                continue
+            try:
+                value = json.loads(params[param])
+            except (TypeError, ValueError):
+                value = None
+            if not isinstance(value, dict):
+                return JsonResponse({
+                    'error': 'InvalidRequestParam',
+                    'param': param,
+                })
+            params[param] = value
         # Perform an action on the cart using these parameters
         cart = Cart(request)
         action = getattr(cart, self.action)
@@ -117,6 +140,19 @@ class AddItem(CartView):
     optional_params = {'quantity': 1}
 
 
+class AddItems(CartView):
+    """Add several items to the cart at once.
+
+    Expects `request.POST` to contain key *items*. The associated value
+    should be a JSON-object mapping primary keys of items to quantities
+    to add, for example: ``'{"1": 2, "4": 1}'``.
+
+    """
+    action = 'add_many'
+    required_params = ('items',)
+    json_params = ('items',)
+
+
 class ChangeItemQuantity(CartView):
     """Change the quantity associated with an item.
 
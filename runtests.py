@@ -1,15 +1,7 @@
 #!/usr/bin/env python
-import argparse
 import os
 import sys
 
-import django
-from django.conf import settings
-from django.test.utils import get_runner
-
-os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
-django.setup()
-
 HELP_TEST_LABEL = """\
 A test label can take one of the four forms:
 - path.to.test_module.TestCase.test_method
@@ -26,17 +18,46 @@ HELP_FAILFAST = 'stop after the first test failure is detected'
 HELP_REVERSE = 'sort test cases in the opposite execution order'
 HELP_VERBOSITY = 'the amount of notification and debug information '
 
-parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
-add_arg = parser.add_argument
-add_arg('test_labels', metavar='test_label', nargs='*', help=HELP_TEST_LABEL)
-add_arg('-f', '--failfast', action='store_true', help=HELP_FAILFAST)
-add_arg('-r', '--reverse', action='store_true', help=HELP_REVERSE)
-add_arg('-v', '--verbosity', choices=(0, 1, 2), default=1, type=int,
-        help=HELP_VERBOSITY)
-args = parser.parse_args()
 
-TestRunner = get_runner(settings)
-test_runner = TestRunner(verbosity=args.verbosity, reverse=args.reverse,
-                         failfast=args.failfast)
-failures = test_runner.run_tests(args.test_labels)
-sys.exit(bool(failures))
+def parse_args():
+    """Return test labels and test runner options from the command line."""
+    if len(sys.argv) == 1:
+        # Running the whole test suite with default options doesn't need
+        # the argument parser.
+        return [], {'verbosity': 1, 'reverse': False, 'failfast': False}
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawTextHelpFormatter)
+    add_arg = parser.add_argument
+    add_arg('test_labels', metavar='test_label', nargs='*',
+            help=HELP_TEST_LABEL)
+    add_arg('-f', '--failfast', action='store_true', help=HELP_FAILFAST)
+    add_arg('-r', '--reverse', action='store_true', help=HELP_REVERSE)
+    add_arg('-v', '--verbosity', choices=(0, 1, 2), default=1, type=int,
+            help=HELP_VERBOSITY)
+    args = parser.parse_args()
+    options = {
+        'verbosity': args.verbosity,
+        'reverse': args.reverse,
+        'failfast': args.failfast,
+    }
+    return args.test_labels, options
+
+
+def main():
+    test_labels, options = parse_args()
+    # Django is set up only after the arguments are parsed, so that --help
+    # and invalid arguments don't have to wait for it.
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
+    import django
+    from django.conf import settings
+    from django.test.utils import get_runner
+    django.setup()
+    TestRunner = get_runner(settings)
+    test_runner = TestRunner(**options)
+    failures = test_runner.run_tests(test_labels)
+    sys.exit(bool(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 """Code used by multiple test modules."""
-from copy import deepcopy
+import json
 from importlib import import_module
 
 from django.conf import settings
@@ -7,6 +7,11 @@ from django.conf import settings
 from easycart import BaseCart, BaseItem
 from tests.models import Item, Book, Magazine
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 SESSION_KEY = 'easycart'
 
 SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
@@ -25,14 +30,27 @@ DUMMY_SESSION_DATA = {
 
 def set_up_session(session):
     """Augment the given instance of SessionStore with dummy data."""
-    session.set_test_cookie()
-    session[SESSION_KEY] = deepcopy(DUMMY_SESSION_DATA)
+    # The cart changes session items in place, so each of them is copied
+    session[SESSION_KEY] = {
+        'items': {pk: dict(item)
+                  for pk, item in DUMMY_SESSION_DATA['items'].items()},
+        'itemCount': DUMMY_SESSION_DATA['itemCount'],
+        'totalPrice': DUMMY_SESSION_DATA['totalPrice'],
+    }
     session.save()
     return session
 
 
+def decode_json(content):
+    """Decode the JSON body of a response, preferring orjson if installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content.decode('utf-8'))
+
+
 def fill_db():
     """Fill the test db with dummy items."""
+    # bulk_create() doesn't support multi-table inheritance
     Book.objects.create(name='Moby-Dick', price=3, author='Melville')
     Book.objects.create(name='The Idiot', price=5, author='Dostoyevsky')
     Magazine.objects.create(name='Cosmos', price=1.5, issue='8 April 2016')
@@ -47,7 +65,8 @@ class Cart(BaseCart):
     ITEM_CLASS = CartItem
 
     def get_queryset(self, pks):
-        return Item.objects.filter(pk__in=pks)
+        return Item.objects.select_related('book', 'magazine').filter(
+            pk__in=pks)
 
     def process_object(self, obj):
         return getattr(obj, obj.category)
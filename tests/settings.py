@@ -3,7 +3,7 @@ EASYCART_CART_CLASS = 'tests.common.Cart'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': 'test.db',
+        'NAME': ':memory:',
     }
 }
 
@@ -14,9 +14,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE_CLASSES = [
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
 ]
 
 ROOT_URLCONF = 'tests.urls'
 
 SECRET_KEY = 'dummy-key'
+
+# Keep sessions in the local-memory cache rather than in the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
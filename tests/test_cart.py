@@ -1,12 +1,12 @@
 """Tests for easycart.cart."""
-import json
-from copy import deepcopy
+from decimal import Decimal
 try:
     from unittest.mock import Mock, patch
 except ImportError:
     from mock import Mock, patch
 
 from django.test import TestCase, RequestFactory
+from django.utils import six
 
 from easycart import (
     BaseItem,
@@ -19,6 +19,7 @@ from tests.common import (
     SESSION_KEY,
     Cart,
     SessionStore,
+    decode_json,
     fill_db,
     set_up_session,
 )
@@ -27,6 +28,20 @@ from tests.models import Item, Book, Magazine
 request_factory = RequestFactory()
 
 
+class _CallCounter(object):
+    """Wrap a callable and count how many times it has been called."""
+
+    __slots__ = ('fn', 'count')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+        return self.fn(*args, **kwargs)
+
+
 class TestBaseItem(TestCase):
 
     def setUp(self):
@@ -47,6 +62,11 @@ class TestBaseItem(TestCase):
         self.assertEqual(item.foo, 'foo')
         self.assertEqual(item.bar, 'bar')
 
+    def test_only_extra_attributes_are_stored_in_instance_dict(self):
+        self.assertEqual(BaseItem(self.obj, 3).__dict__, {})
+        self.assertEqual(BaseItem(self.obj, 3, foo='bar').__dict__,
+                         {'foo': 'bar'})
+
     def test_constructor_cleans_quantity(self):
         with patch.object(BaseItem, 'clean_quantity') as mock_clean_quantity:
             mock_clean_quantity.return_value = 'cleaned'
@@ -99,6 +119,17 @@ class TestBaseItem(TestCase):
         self.assertEqual(item_4, item_4)
         self.assertEqual(item_4, item_5)
         self.assertNotEqual(item_4, item_6)
+        # Items of different classes are never equal
+
+        class OtherItem(BaseItem):
+            pass
+
+        self.assertNotEqual(item_1, OtherItem(self.obj))
+        self.assertNotEqual(item_1, None)
+        # Items are equal only if their objects are equal model instances
+        self.assertNotEqual(BaseItem(Book(name='a', price=1)),
+                            BaseItem(Book(name='b', price=2)))
+        self.assertNotEqual(item_1, BaseItem(Book(pk=1, price=100)))
 
     def test__repr__(self):
         item = BaseItem(self.obj, 1)
@@ -118,20 +149,33 @@ class TestBaseItem(TestCase):
 
 class TestBaseCart(TestCase):
 
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         fill_db()
+        cls.books = Book.objects.in_bulk([1, 2])
+        cls.magazines = Magazine.objects.in_bulk([3, 4])
+        # Items expected to be in the cart created from the dummy session
+        cls.expected_items = {
+            '1': BaseItem(cls.books[1], 10),
+            '2': BaseItem(cls.books[2], 12),
+            '3': BaseItem(cls.magazines[3], 6),
+            '4': BaseItem(cls.magazines[4], 1),
+        }
+
+    def setUp(self):
         request = request_factory.post('')
         request.session = SessionStore()
         set_up_session(request.session)
         cart = Cart(request)
-        mock_update = Mock(wraps=cart.update)
-        patch.object(cart, 'update', mock_update).start()
-        self.addCleanup(patch.stopall)
-        self.mock_update = mock_update
+        # The cart is created anew for each test, so no patcher is needed
+        cart.update = self.update_counter = _CallCounter(cart.update)
         self.request = request
         self.cart = cart
         self.cart_session = request.session[SESSION_KEY]
 
+    def get_quantities(self):
+        return {pk: item.quantity for pk, item in self.cart.items.items()}
+
     def assert_cart_is_empty(self, cart):
         self.assertEqual(cart.items, {})
         self.assertEqual(cart.item_count, 0)
@@ -153,24 +197,63 @@ class TestBaseCart(TestCase):
         cart = Cart(self.request)
         self.assert_cart_is_empty(cart)
 
+    def test_empty_cart_is_not_saved_to_session_until_updated(self):
+        self.request.session = SessionStore()
+        cart = Cart(self.request)
+        self.assertNotIn(SESSION_KEY, self.request.session)
+        self.assertFalse(self.request.session.modified)
+        cart.add('1')
+        self.assertTrue(self.request.session.modified)
+        self.cart_session = self.request.session[SESSION_KEY]
+        self.cart = cart
+        self.assert_session_reflects_cart_state()
+
+    def test_items_are_fetched_with_a_single_query(self):
+        with self.assertNumQueries(1):
+            Cart(self.request)
+
+    def test_empty_cart_does_not_query_database(self):
+        del self.request.session[SESSION_KEY]
+        with self.assertNumQueries(0):
+            Cart(self.request)
+
+    def test_get_queryset_may_return_any_iterable(self):
+
+        class InBulkCart(Cart):
+
+            def get_queryset(self, pks):
+                queryset = super(InBulkCart, self).get_queryset(pks)
+                return queryset.in_bulk(pks).values()
+
+        cart = InBulkCart(self.request)
+        self.assertDictEqual(cart.items, self.expected_items)
+        first = Book.objects.create(name='foo', price=1)
+        second = Book.objects.create(name='bar', price=2)
+        cart.add(first.pk)
+        cart.add_many({second.pk: 1})
+        self.assertEqual(cart.items[str(first.pk)], BaseItem(first, 1))
+        self.assertEqual(cart.items[str(second.pk)], BaseItem(second, 1))
+
     def test_initial_cart_state_with_dummy_session(self):
         cart = self.cart
         self.assertEqual(cart.item_count, 4)
-        self.assertEqual(cart.total_price, '101.00')
-        self.assertEqual(
-            cart.items,
-            {
-                '1': BaseItem(Book.objects.get(pk=1), 10),
-                '2': BaseItem(Book.objects.get(pk=2), 12),
-                '3': BaseItem(Magazine.objects.get(pk=3), 6),
-                '4': BaseItem(Magazine.objects.get(pk=4), 1),
-            }
-        )
+        self.assertEqual(cart.total_price, Decimal('101.00'))
+        self.assertDictEqual(cart.items, self.expected_items)
 
     def test_update_does_not_corrupt_session(self):
         self.cart.update()
         self.assertEqual(self.cart_session, DUMMY_SESSION_DATA)
 
+    def test_update_does_not_modify_session_if_cart_is_unchanged(self):
+        session = self.request.session
+        session.modified = False
+        self.cart.update()
+        self.assertFalse(session.modified)
+        self.cart.items['1'].quantity = 20
+        self.cart.update()
+        self.assertTrue(session.modified)
+        self.assert_session_reflects_cart_state()
+
     def test_update_after_direct_modification_of_items(self):
         cart = self.cart
         del cart.items['1']
@@ -193,12 +276,76 @@ class TestBaseCart(TestCase):
             # Ensure that we get the same items from these session data
             original_cart = self.cart
             new_cart = Cart(self.request)
-            self.assertEqual(new_cart.items, original_cart.items)
+            self.assertDictEqual(new_cart.items, original_cart.items)
 
         test({'foo': 'foo'})
         test({'foo': 'foo', 'bar': 'bar'})
         test({'foo': 'foo', 'bar': 'bar', 'nox': 'nox'})
 
+    def test_totals_are_adjusted_without_recounting(self):
+        cart = self.cart
+        with patch.object(cart, 'count_items') as mock_count_items, \
+                patch.object(cart, 'count_total_price') as mock_count_price:
+            cart.add('1', 2)
+            cart.change_quantity('2', 1)
+            cart.remove('3')
+        self.assertFalse(mock_count_items.called)
+        self.assertFalse(mock_count_price.called)
+        self.assertEqual(cart.item_count, 3)
+        self.assertEqual(cart.total_price, 43)
+        self.assert_session_reflects_cart_state()
+        for pk in list(cart.items):
+            cart.remove(pk)
+        self.assertEqual(str(cart.total_price), '0')
+        self.assertEqual(self.cart_session['totalPrice'], '0')
+
+    def test_session_is_updated_in_place_on_single_item_changes(self):
+        cart = self.cart
+        session_items = self.cart_session['items']
+        untouched_session_item = session_items['2']
+        cart.add('1', 5)
+        cart.change_quantity('3', 1)
+        cart.remove('4')
+        self.assertIs(self.cart_session['items'], session_items)
+        self.assertIs(session_items['2'], untouched_session_item)
+        self.assert_session_reflects_cart_state()
+
+    def test_totals_are_recounted_if_counting_is_customized(self):
+
+        class CustomCart(Cart):
+
+            def count_total_price(self):
+                return super(CustomCart, self).count_total_price() - 1
+
+        cart = CustomCart(self.request)
+        self.assertEqual(cart.total_price, 100)
+        cart.add('1', 2)
+        self.assertEqual(cart.total_price, 106)
+
+    def test_totals_are_recounted_if_prices_are_floats(self):
+
+        class FloatPriceCart(Cart):
+
+            def process_object(self, obj):
+                obj = super(FloatPriceCart, self).process_object(obj)
+                obj.price = float(obj.price)
+                return obj
+
+        first = Book.objects.create(name='foo', price='0.1')
+        second = Book.objects.create(name='bar', price='0.2')
+        self.request.session = SessionStore()
+        cart = FloatPriceCart(self.request)
+        cart.add(first.pk)
+        cart.add(second.pk)
+        cart.remove(first.pk)
+        self.assertEqual(cart.total_price, 0.2)
+        cart.remove(second.pk)
+        self.assertEqual(cart.total_price, 0)
+        cart_session = self.request.session[SESSION_KEY]
+        self.assertEqual(cart_session['totalPrice'], '0')
+        self.assertEqual(decode_json(cart.encode().content)['totalPrice'],
+                         '0')
+
     def test_add_passes_kwargs_to_item_class_if_item_is_not_in_cart(self):
         item = Book.objects.create(name='foo', price=999)
         cart = self.cart
@@ -213,7 +360,7 @@ class TestBaseCart(TestCase):
         new_item_pk = str(new_item.pk)
         self.assertNotIn(new_item_pk, cart.items)
         cart.add(pk=new_item_pk, quantity=1)
-        self.mock_update.assert_called_once_with()
+        self.assertEqual(self.update_counter.count, 1)
         self.assertEqual(cart.items[new_item_pk], BaseItem(new_item, 1))
         self.assertEqual(cart.item_count, 5)
         self.assertEqual(cart.total_price, 1100)
@@ -224,7 +371,7 @@ class TestBaseCart(TestCase):
         self.assertIn('1', cart.items)
         self.assertEqual(cart.items['1'].quantity, 10)
         cart.add(pk='1', quantity=5)
-        self.mock_update.assert_called_once_with()
+        self.assertEqual(self.update_counter.count, 1)
         self.assertEqual(cart.items['1'].quantity, 15)
         self.assertEqual(cart.item_count, 4)
         self.assertEqual(cart.total_price, 116)
@@ -233,12 +380,12 @@ class TestBaseCart(TestCase):
     def test_add_item_in_invalid_quantity(self):
         cart = self.cart
         max_allowed_quantity = BaseItem.max_quantity = 9999
-        orig_items = deepcopy(cart.items)
+        orig_quantities = self.get_quantities()
 
         def test(pk, quantity):
             with self.assertRaises(InvalidItemQuantity):
                 cart.add(pk=pk, quantity=quantity)
-            self.assertEqual(cart.items, orig_items)
+            self.assertEqual(self.get_quantities(), orig_quantities)
             self.assert_session_reflects_cart_state()
 
         # With an item that is already in the cart
@@ -252,23 +399,88 @@ class TestBaseCart(TestCase):
         test(new_item_pk, -1)
         test(new_item_pk, max_allowed_quantity+1)
 
+    def test_add_fetches_each_object_once_per_request(self):
+        cart = self.cart
+        new_item = Book.objects.create(name='foo', price=999)
+        with patch.object(cart, 'get_queryset',
+                          wraps=cart.get_queryset) as mock_get_queryset:
+            cart.add(new_item.pk)
+            cart.remove(new_item.pk)
+            cart.add(new_item.pk)
+        mock_get_queryset.assert_called_once_with([str(new_item.pk)])
+        self.assertEqual(cart.items[str(new_item.pk)], BaseItem(new_item, 1))
+
+    def test_add_does_not_share_fetched_objects_between_cart_classes(self):
+
+        class MagazineCart(Cart):
+
+            def get_queryset(self, pks):
+                return Magazine.objects.filter(pk__in=pks)
+
+        new_item = Book.objects.create(name='foo', price=999)
+        self.cart.add(new_item.pk)
+        self.cart.remove(new_item.pk)
+        with self.assertRaises(ItemNotInDatabase):
+            MagazineCart(self.request).add(new_item.pk)
+
+    def test_add_many_items(self):
+        cart = self.cart
+        new_item = Book.objects.create(name='foo', price=999)
+        new_item_pk = str(new_item.pk)
+        with patch.object(cart, 'get_queryset',
+                          wraps=cart.get_queryset) as mock_get_queryset:
+            cart.add_many({'1': 5, new_item.pk: 2})
+        mock_get_queryset.assert_called_once_with([new_item_pk])
+        self.assertEqual(self.update_counter.count, 1)
+        self.assertEqual(cart.items['1'].quantity, 15)
+        self.assertEqual(cart.items[new_item_pk], BaseItem(new_item, 2))
+        self.assertEqual(cart.item_count, 5)
+        self.assertEqual(cart.total_price, 2114)
+        self.assert_session_reflects_cart_state()
+
+    def test_add_many_adds_up_quantities_of_same_item(self):
+        self.cart.add_many({1: 1, '1': 2})
+        self.assertEqual(self.cart.items['1'].quantity, 13)
+        self.assert_session_reflects_cart_state()
+
+    def test_add_many_leaves_cart_unchanged_on_error(self):
+        cart = self.cart
+        max_allowed_quantity = BaseItem.max_quantity = 9999
+        new_item = Book.objects.create(name='foo', price=999)
+        orig_quantities = self.get_quantities()
+
+        def test(items, exception):
+            with self.assertRaises(exception):
+                cart.add_many(items)
+            self.assertEqual(self.update_counter.count, 0)
+            self.assertEqual(self.get_quantities(), orig_quantities)
+
+        test({'1': 1, '999': 1}, ItemNotInDatabase)
+        test({'1': 1, new_item.pk: 0}, InvalidItemQuantity)
+        test({'1': max_allowed_quantity, new_item.pk: 1}, InvalidItemQuantity)
+
+    def test_add_many_checks_quantities_before_querying_database(self):
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidItemQuantity):
+                self.cart.add_many({'999': 1, '998': 'xxx'})
+
     def test_change_item_quantity_to_valid_value(self):
         cart = self.cart
         cart.change_quantity('1', 20)
         self.assertEqual(cart.items['1'].quantity, 20)
         self.assertEqual(cart.items['1'].total, 60)
-        self.mock_update.assert_called_once_with()
+        self.assertEqual(self.update_counter.count, 1)
 
     def test_change_item_quantity_to_invalid_value(self):
         cart = self.cart
-        orig_items = deepcopy(cart.items)
+        orig_quantities = self.get_quantities()
         max_allowed_quantity = BaseItem.max_quantity = 9999
 
         def test(quantity):
             with self.assertRaises(InvalidItemQuantity):
                 cart.change_quantity('1', quantity)
-            self.assertFalse(self.mock_update.called)
-            self.assertEqual(cart.items, orig_items)
+            self.assertEqual(self.update_counter.count, 0)
+            self.assertEqual(self.get_quantities(), orig_quantities)
             self.assert_session_reflects_cart_state()
 
         test(0)
@@ -278,7 +490,7 @@ class TestBaseCart(TestCase):
     def test_change_item_quantity_of_item_missing_from_cart(self):
         with self.assertRaises(ItemNotInCart):
             self.cart.change_quantity('no-such-item-in-cart', 10)
-        self.assertFalse(self.mock_update.called)
+        self.assertEqual(self.update_counter.count, 0)
 
     def test_remove_item_present_in_cart(self):
         cart = self.cart
@@ -291,24 +503,34 @@ class TestBaseCart(TestCase):
 
     def test_remove_item_missing_from_cart(self):
         cart = self.cart
-        orig_items = deepcopy(cart.items)
+        orig_quantities = self.get_quantities()
         with self.assertRaises(ItemNotInCart):
-            self.cart.remove('999')
-        self.assertFalse(self.mock_update.called)
-        self.assertEqual(cart.items, orig_items)
+            cart.remove('999')
+        self.assertEqual(self.update_counter.count, 0)
+        self.assertEqual(self.get_quantities(), orig_quantities)
 
     def test_empty_cart(self):
         cart = self.cart
         cart.empty()
-        self.mock_update.assert_called_once_with()
+        self.assertEqual(self.update_counter.count, 1)
         self.assert_cart_is_empty(cart)
         self.assert_session_reflects_cart_state()
 
+    def test_empty_cart_that_is_already_empty(self):
+        cart = self.cart
+        cart.empty()
+        self.update_counter.count = 0
+        self.request.session.modified = False
+        cart.empty()
+        self.assertEqual(self.update_counter.count, 0)
+        self.assertFalse(self.request.session.modified)
+        self.assert_cart_is_empty(cart)
+
     def test_encode_cart(self):
 
         def get_response(formatter=None):
             response = self.cart.encode(formatter)
-            return json.loads(response.content.decode('utf-8'))
+            return decode_json(response.content)
 
         expected_response = {
             'items': {
@@ -333,32 +555,88 @@ class TestBaseCart(TestCase):
         expected_response['totalPrice'] = '101.00 $'
         self.assertEqual(get_response(format_total_price), expected_response)
 
+    def test_encoded_cart_is_cached_until_update(self):
+        cart = self.cart
+        content = cart.encode().content
+        with patch('easycart.cart._dump_json') as mock_dump_json:
+            self.assertEqual(cart.encode().content, content)
+        self.assertFalse(mock_dump_json.called)
+        cart.add('1')
+        self.assertNotEqual(cart.encode().content, content)
+        # A formatted representation is never taken from the cache
+        formatted_content = cart.encode(lambda cart_repr: {}).content
+        self.assertEqual(decode_json(formatted_content), {})
+
+    def test_encode_cart_without_orjson(self):
+        expected_content = self.cart.encode().content
+        with patch('easycart.cart.orjson', None):
+            response = self.cart.encode()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(decode_json(response.content),
+                         decode_json(expected_content))
+
+    def test_encode_cart_with_non_string_keys(self):
+
+        def key_items_by_int(cart_repr):
+            items = cart_repr['items']
+            cart_repr['items'] = {int(pk): item for pk, item in items.items()}
+            return cart_repr
+
+        response = self.cart.encode(key_items_by_int)
+        self.assertEqual(decode_json(response.content)['items'],
+                         decode_json(self.cart.encode().content)['items'])
+
+    def test_encode_cart_with_integers_beyond_64_bits(self):
+
+        def set_huge_item_count(cart_repr):
+            cart_repr['itemCount'] = 2 ** 64
+            return cart_repr
+
+        response = self.cart.encode(set_huge_item_count)
+        self.assertEqual(decode_json(response.content)['itemCount'], 2 ** 64)
+
     def test_stale_item_handler_is_not_called_if_cart_has_no_stale_items(self):
         with patch.object(Cart, 'handle_stale_items') as mock_handler:
             cart = Cart(self.request)  #pylint:disable=unused-variable
         self.assertFalse(mock_handler.called)
 
     def test_stale_item_handler_is_called_if_cart_has_stale_items(self):
-        Book.objects.get(pk=1).delete()
+        Book.objects.filter(pk=1).delete()
         with patch.object(Cart, 'handle_stale_items') as mock_handler:
             cart = Cart(self.request)  #pylint:disable=unused-variable
         mock_handler.assert_called_once_with({'1'})
 
     def test_stale_items_are_silently_removed(self):
-        Book.objects.get(pk=1).delete()
-        Book.objects.get(pk=2).delete()
+        Book.objects.filter(pk__in=[1, 2]).delete()
         cart = Cart(self.request)
         self.assertEqual(cart.item_count, 2)
         self.assertEqual(cart.total_price, 11)
 
+    def test_stale_items_are_removed_from_session_on_next_change(self):
+
+        class KeepStaleItemsCart(Cart):
+
+            def handle_stale_items(self, pks):
+                pass
+
+        self.cart_session['items']['99'] = {'quantity': 1}
+        self.request.session.save()
+        cart = self.cart = KeepStaleItemsCart(self.request)
+        self.assertIn('99', self.cart_session['items'])
+        cart.add('1')
+        self.assertNotIn('99', self.cart_session['items'])
+        self.assert_session_reflects_cart_state()
+
     def test_list_items(self):
-        self.assertEqual(
-            sorted(self.cart.list_items(), key=lambda item: item.quantity),
+        expected_items = self.expected_items
+        six.assertCountEqual(
+            self,
+            self.cart.list_items(),
             [
-                BaseItem(Magazine.objects.get(pk=4), 1),
-                BaseItem(Magazine.objects.get(pk=3), 6),
-                BaseItem(Book.objects.get(pk=1), 10),
-                BaseItem(Book.objects.get(pk=2), 12),
+                expected_items['1'],
+                expected_items['2'],
+                expected_items['3'],
+                expected_items['4'],
             ]
         )
 
@@ -1,7 +1,13 @@
 """Tests for cart.context_processors."""
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 from django.core.urlresolvers import reverse
-from django.test import TestCase, override_settings
+from django.test import TestCase, RequestFactory, override_settings
 
+from easycart import context_processors
 from tests.common import Cart, fill_db, set_up_session
 
 
@@ -18,8 +24,11 @@ from tests.common import Cart, fill_db, set_up_session
 )
 class TestContextProcessors(TestCase):
 
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         fill_db()
+
+    def setUp(self):
         set_up_session(self.client.session)
 
     def test_context_has_cart_variable(self):
@@ -31,3 +40,19 @@ class TestContextProcessors(TestCase):
         self.assertTrue(isinstance(cart, Cart))
         # Ensure the cart instance has been correctly initialized
         self.assertEqual(len(cart.items), 4)
+
+    def test_cart_is_not_created_until_accessed(self):
+        request = RequestFactory().get('')
+        with patch.object(context_processors, 'Cart') as MockCart:
+            context = context_processors.cart(request)
+            self.assertFalse(MockCart.called)
+            context['cart'].items  #pylint:disable=pointless-statement
+            MockCart.assert_called_once_with(request)
+
+    def test_cart_is_created_at_once_if_eager_context_is_enabled(self):
+        request = RequestFactory().get('')
+        with patch.object(context_processors, 'Cart') as MockCart, \
+                patch.object(context_processors, 'eager_context', True):
+            context = context_processors.cart(request)
+            MockCart.assert_called_once_with(request)
+        self.assertIs(context['cart'], MockCart.return_value)
@@ -0,0 +1,13 @@
+"""Tests for easycart.loading."""
+from django.test import SimpleTestCase
+
+from easycart import views
+from easycart.loading import get_cart_class
+from tests.common import Cart
+
+
+class TestLoading(SimpleTestCase):
+
+    def test_get_cart_class(self):
+        self.assertIs(get_cart_class(), Cart)
+        self.assertIs(get_cart_class(), views.Cart)
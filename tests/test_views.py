@@ -1,24 +1,44 @@
 """Tests for cart.views."""
 import json
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 
-from tests.common import fill_db, set_up_session
+from easycart.views import Cart, CartView
+from tests.common import (
+    SessionStore,
+    decode_json,
+    fill_db,
+    set_up_session,
+)
 
 
 class TestViews(TestCase):
 
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
+        super(TestViews, cls).setUpClass()
+        url_names = ('cart-add', 'cart-add-many', 'cart-remove',
+                     'cart-change-quantity', 'cart-empty')
+        cls.view_urls = {name: reverse(name) for name in url_names}
+
+    @classmethod
+    def setUpTestData(cls):
         fill_db()
+
+    def setUp(self):
         set_up_session(self.client.session)
 
     def check_response(self, url_name, post_data, expected):
-        url = reverse(url_name)
+        url = self.view_urls[url_name]
         response = self.client.post(url, post_data)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/json')
-        actual = json.loads(response.content.decode('utf-8'))
+        actual = decode_json(response.content)
         self.assertEqual(actual, expected)
 
     def test_add_item(self):
@@ -93,6 +113,75 @@ class TestViews(TestCase):
             {'error': 'NonConvertibleItemQuantity', 'quantity': 'xxx'}
         )
 
+    def test_add_many_items(self):
+        self.check_response(
+            'cart-add-many',
+            {'items': json.dumps({'1': 5, '2': 1})},
+            {'items': {'1': {'price': '3.00', 'quantity': 15, 'total': '45.00'},
+                       '2': {'price': '5.00', 'quantity': 13, 'total': '65.00'},
+                       '3': {'price': '1.50', 'quantity': 6, 'total': '9.00'},
+                       '4': {'price': '2.00', 'quantity': 1, 'total': '2.00'}},
+             'itemCount': 4,
+             'totalPrice': '121.00'}
+        )
+
+    def test_add_many_items_without_items(self):
+        self.check_response(
+            'cart-add-many',
+            {},
+            {'error': 'MissingRequestParam', 'param': 'items'}
+        )
+
+    def test_add_many_items_with_invalid_items(self):
+        """If post data contain parameter 'items' and the associated value
+        is not a JSON-object, then the response is expected to contain the
+        relevant error message.
+        """
+        for items in ('xxx', '[1, 2]'):
+            self.check_response(
+                'cart-add-many',
+                {'items': items},
+                {'error': 'InvalidRequestParam', 'param': 'items'}
+            )
+
+    def test_add_many_items_with_negative_quantity(self):
+        self.check_response(
+            'cart-add-many',
+            {'items': json.dumps({'1': -1})},
+            {'error': 'NegativeItemQuantity', 'quantity': -1}
+        )
+
+    def make_request(self):
+        request = RequestFactory().post('')
+        request.session = set_up_session(SessionStore())
+        return request
+
+    def test_json_param_missing_from_params_is_ignored(self):
+
+        class EmptyCartView(CartView):
+            action = 'empty'
+            json_params = ('items',)
+
+        response = EmptyCartView.as_view()(self.make_request())
+        self.assertEqual(decode_json(response.content)['itemCount'], 0)
+
+    def test_json_param_with_non_string_fallback(self):
+
+        class AddItemsView(CartView):
+            action = 'add_many'
+            optional_params = {'items': {'1': 1}}
+            json_params = ('items',)
+
+        response = AddItemsView.as_view()(self.make_request())
+        self.assertEqual(decode_json(response.content),
+                         {'error': 'InvalidRequestParam', 'param': 'items'})
+
+    def test_action_is_looked_up_on_each_request(self):
+        self.client.post(self.view_urls['cart-empty'])
+        with patch.object(Cart, 'empty') as mock_empty:
+            self.client.post(self.view_urls['cart-empty'])
+        mock_empty.assert_called_once_with()
+
     def test_remove_item(self):
         self.check_response(
             'cart-remove',